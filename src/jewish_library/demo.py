@@ -1,13 +1,10 @@
 from tantivy_search_agent import TantivySearchAgent
-import os
+from pathlib import Path
 import asyncio
 
 # Initialize TantivySearchAgent with the index path
-current_dir = os.path.dirname(os.path.abspath(__file__))
-index_path = os.path.join(os.path.dirname(os.path.dirname(current_dir)), "index")
-search_agent = TantivySearchAgent(index_path)
-
-import os
+INDEX_PATH = Path(__file__).resolve().parent.parent.parent / "index"
+search_agent = TantivySearchAgent(str(INDEX_PATH))
 
 async def print_search   ():
     results = await search_agent.search("גזלן קונה בשינוי")
@@ -3,28 +3,46 @@ import mcp.types as types
 from mcp.server import NotificationOptions, Server
 import mcp.server.stdio
 import asyncio
-import os
+import atexit
 import logging
+import logging.handlers
+import queue
 import sys
-import json
+from pathlib import Path
 from .tantivy_search_agent import TantivySearchAgent
 
+# Use the libuv-based event loop when it is installed
+try:
+    import uvloop
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+except ImportError:
+    pass
+
 # Configure logging
+# Records are queued on the calling thread and written to stderr and the log
+# file by a background listener, so logging never blocks the event loop
+log_formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+log_handlers = [
+    logging.StreamHandler(sys.stderr),
+    logging.FileHandler('jewish_library.log', encoding='utf-8')
+]
+for handler in log_handlers:
+    handler.setFormatter(log_formatter)
+log_queue = queue.Queue(-1)
+log_listener = logging.handlers.QueueListener(log_queue, *log_handlers, respect_handler_level=True)
+log_listener.start()
+atexit.register(log_listener.stop)
 logging.basicConfig(
     level=logging.ERROR,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(sys.stderr),
-        logging.FileHandler('jewish_library.log', encoding='utf-8')
-    ]
+    format='%(message)s',
+    handlers=[logging.handlers.QueueHandler(log_queue)]
 )
 logger = logging.getLogger('jewish_library')
 
 # Initialize TantivySearchAgent with the index path
-current_dir = os.path.dirname(os.path.abspath(__file__))
-index_path = os.path.join(os.path.dirname(os.path.dirname(current_dir)), "index")
+INDEX_PATH = Path(__file__).resolve().parent.parent.parent / "index"
 try:
-    search_agent = TantivySearchAgent(index_path)
+    search_agent = TantivySearchAgent(str(INDEX_PATH))
     logger.info("Search agent initialized")
 except Exception as e:
     logger.error(f"Failed to initialize search agent: {e}")
@@ -33,23 +51,17 @@ except Exception as e:
 
 server = Server("jewish_library")
 
-@server.list_tools()
-async def handle_list_tools() -> list[types.Tool]:
-    """
-    List available tools.
-    Each tool specifies its arguments using JSON Schema validation.
-    """
-    logger.debug("Handling list_tools request")
-    return [
-        types.Tool(
-            name="full_text_search",
-            description="Full text searching in the jewish library",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "query": {
-                        "type": "string",
-                        "description": """
+# The tool list is static, so build it once instead of on every list_tools call
+TOOLS = [
+    types.Tool(
+        name="full_text_search",
+        description="Full text searching in the jewish library",
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "query": {
+                    "type": "string",
+                    "description": """
 Instructions for generating a query:
 
 1. Boolean Operators:
@@ -109,18 +121,26 @@ Tips:
 - use field-specific terms for better results. 
 - the corpus to search in is an ancient Hebrew corpus: Tora and Talmud. so Try to use ancient Hebrew terms and or Talmudic expressions and prevent modern words that are not common in talmudic texts
 """
-                    },
-                    "num_results": {
-                        "type": "integer",
-                        "description": "The maximum number of results to return (default: 25)",
-                        "default": 25,
-                    },
                 },
-                "required": ["query"],
+                "num_results": {
+                    "type": "integer",
+                    "description": "The maximum number of results to return (default: 25)",
+                    "default": 25,
+                },
             },
-        ),
-   
-    ]
+            "required": ["query"],
+        },
+    ),
+]
+
+@server.list_tools()
+async def handle_list_tools() -> list[types.Tool]:
+    """
+    List available tools.
+    Each tool specifies its arguments using JSON Schema validation.
+    """
+    logger.debug("Handling list_tools request")
+    return TOOLS
 
 @server.call_tool()
 async def handle_call_tool(
@@ -130,7 +150,7 @@ async def handle_call_tool(
     Handle tool execution requests.
     Tools can search the Jewish library and return formatted results.
     """
-    logger.debug(f"Handling call_tool request for {name} with arguments {arguments}")
+    logger.debug("Handling call_tool request for %s with arguments %s", name, arguments)
     
     try:
         if not arguments:
@@ -145,12 +165,15 @@ async def handle_call_tool(
                 if not isinstance(num_results, int) or num_results <= 0:
                     raise ValueError("Invalid num_results parameter")
                 
-                logger.info(f"Searching with query: {query}")
+                logger.info("Searching with query: %s", query)
                 
                 # Now do the actual search
-                logger.debug(f"Executing search with query: {query}")
-                results = await search_agent.search(query, num_results = num_results)
-                logger.debug(f"Search completed: {len(results)} results")
+                logger.debug("Executing search with query: %s", query)
+                # Only text and reference are returned, so skip snippet extraction
+                results = await search_agent.search(
+                    query, num_results=num_results, include_highlights=False
+                )
+                logger.debug("Search completed: %d results", len(results))
                 
                 if not results or len(results) == 0:
                     logger.info("No results found")
@@ -159,15 +182,16 @@ async def handle_call_tool(
                         text="No results found"
                     )]
                 
-                formatted_results = []
-                for result in results:
-                    text = result.get('text', 'N/A')
-                    reference = result.get('reference', 'N/A')
-                    formatted_results.append(f"Reference: {reference}\nText: {text}\n")
+                # Format each result with a single f-string and join once at the end
+                formatted_results = [
+                    f"Reference: {result.reference or 'N/A'}\nText: {result.text or 'N/A'}\n"
+                    for result in results
+                ]
                 
-                logger.info(f"Found {len(formatted_results)} results")
+                logger.info("Found %d results", len(formatted_results))
                 response_text = "\n\n".join(formatted_results)
-                logger.debug(f"Response text: {response_text}")
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("Response text: %s", response_text)
                 
                 return [
                     types.TextContent(
@@ -1,10 +1,127 @@
-from typing import List, Dict, Any, Optional
-from tantivy import Index, Searcher
+from typing import List, Dict, Any, NamedTuple, Optional, Tuple
+from tantivy import Index
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import copy
 import logging
+import mmap
 import os
+import sys
+import threading
 import re
 import asyncio
-from functools import partial
+import unicodedata
+
+
+# Maximum number of (query, num_results, include_highlights) entries kept in the result cache
+RESULT_CACHE_SIZE = 1024
+
+# Maximum number of parsed queries kept for reuse across searches
+QUERY_CACHE_SIZE = 512
+
+# Query syntax stripped from the query before extracting highlight terms
+_CLEAN_RE = re.compile(r'[:"()[\]{}^~*\\]|\b(AND|OR|NOT|TO|IN)\b|[-+]')
+
+# Frequent term searched at startup so hot index pages are already cached
+WARMUP_QUERY = "את"
+
+# Index segment files that are memory mapped and read on every query
+MMAP_ADVISE_SUFFIXES = (".term", ".idx", ".pos", ".store", ".fieldnorm")
+
+# Characters of context kept on each side of a highlighted match
+HIGHLIGHT_CONTEXT = 100
+
+
+class SearchHit(NamedTuple):
+    """A single search result"""
+    score: float
+    title: str
+    reference: Optional[str]
+    topics: Optional[str]
+    file_path: Optional[str]
+    line_number: Optional[int]
+    is_pdf: Optional[bool]
+    text: str
+    highlights: Optional[List[str]]
+
+
+def _first(fields: Dict[str, list], name: str):
+    """Return the first stored value of a field from Document.to_dict() output, like Document.get_first"""
+    values = fields.get(name)
+    return values[0] if values else None
+
+
+def _fold(text: str) -> Tuple[str, Optional[List[int]], Optional[List[int]]]:
+    """NFC-normalize and casefold text for matching.
+
+    Returns the folded string and, for each folded character, the start and
+    end offsets in text of the character cluster (a base character and its
+    combining marks) it came from. Both offset lists are None when folding
+    leaves every offset in place.
+    """
+    if unicodedata.is_normalized("NFC", text):
+        folded = text.casefold()
+        if len(folded) == len(text):
+            return folded, None, None
+
+    parts = []
+    starts: List[int] = []
+    ends: List[int] = []
+    cluster_start = 0
+    for i in range(1, len(text) + 1):
+        # A cluster ends before the next non-combining character
+        if i < len(text) and unicodedata.combining(text[i]):
+            continue
+        part = unicodedata.normalize("NFC", text[cluster_start:i]).casefold()
+        parts.append(part)
+        starts.extend([cluster_start] * len(part))
+        ends.extend([i] * len(part))
+        cluster_start = i
+    return "".join(parts), starts, ends
+
+
+def _extract_highlights(text: str, terms: List[str]) -> List[str]:
+    """Return context snippets around every occurrence of the (_fold-ed) terms in text.
+
+    Matching runs on the folded text; snippets are always sliced from text itself.
+    """
+    text_lc, starts, ends = _fold(text)
+
+    spans = []
+    for term in terms:
+        idx = text_lc.find(term)
+        while idx != -1:
+            end = idx + len(term)
+            if starts is None:
+                spans.append((idx, end))
+            else:
+                # Map the match back to whole clusters of the original text
+                spans.append((starts[idx], ends[end - 1]))
+            idx = text_lc.find(term, end)
+
+    if not spans:
+        return [text[:HIGHLIGHT_CONTEXT] + "..." if len(text) > HIGHLIGHT_CONTEXT else text]
+
+    # Merge overlapping matches so each is reported once, in document order
+    spans.sort()
+    merged = [list(spans[0])]
+    for span_start, span_end in spans[1:]:
+        if span_start < merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], span_end)
+        else:
+            merged.append([span_start, span_end])
+
+    highlights = []
+    for span_start, span_end in merged:
+        start = max(0, span_start - HIGHLIGHT_CONTEXT)
+        end = min(len(text), span_end + HIGHLIGHT_CONTEXT)
+        highlight = text[start:end]
+        if start > 0:
+            highlight = f"...{highlight}"
+        if end < len(text):
+            highlight = f"{highlight}..."
+        highlights.append(highlight)
+    return highlights
 
 
 class TantivySearchAgent:
@@ -14,6 +131,20 @@ class TantivySearchAgent:
         self.logger = logging.getLogger(__name__)
         self.index = None
         self.searcher = None
+        self._mmaps: List[mmap.mmap] = []
+        self._reload_lock = asyncio.Lock()
+        self._result_cache: "OrderedDict[tuple, List[SearchHit]]" = OrderedDict()
+        # Identical queries currently running, with the cache generation they started in
+        self._in_flight: Dict[tuple, Tuple[int, asyncio.Future]] = {}
+        # Bumped by invalidate() so searches started before a refresh don't fill the cache
+        self._generation = 0
+        # Parsed queries, shared by the worker threads
+        self._qcache: "OrderedDict[str, Any]" = OrderedDict()
+        self._qcache_lock = threading.Lock()
+        # Dedicated pool so tantivy work doesn't compete with other blocking calls
+        self._executor = ThreadPoolExecutor(
+            max_workers=max(4, os.cpu_count() or 1), thread_name_prefix="tantivy"
+        )
         try:
             self.index = Index.open(index_path)            
             self.searcher = self.index.searcher()
@@ -21,102 +152,216 @@ class TantivySearchAgent:
         except Exception as e:
             self.logger.error(f"Failed to open Tantivy index: {e}")
             raise
+        self._advise_index_files()
+        if not self.validate_index():
+            self.logger.warning(f"Tantivy index at {index_path} failed validation")
+
+    def _advise_index_files(self) -> None:
+        """Map the index segment files and advise the kernel to back them with huge pages and prefetch them.
+
+        Mappings from a previous call are closed first, so after a reload the
+        files of merged-away segments are released and new segments are advised.
+        """
+        self._release_index_files()
+        if sys.platform != "linux" or not hasattr(mmap, "MADV_HUGEPAGE"):
+            return
+        huge_pages = 0
+        for root, _, files in os.walk(self.index_path):
+            for name in files:
+                if not name.endswith(MMAP_ADVISE_SUFFIXES):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    with open(path, "rb") as f:
+                        if os.fstat(f.fileno()).st_size == 0:
+                            continue
+                        mapped = mmap.mmap(f.fileno(), 0, prot=mmap.PROT_READ)
+                except (OSError, ValueError) as e:
+                    self.logger.debug(f"Failed to map {path}: {e}")
+                    continue
+                # Advise separately: kernels without THP reject MADV_HUGEPAGE
+                try:
+                    mapped.madvise(mmap.MADV_HUGEPAGE)
+                    huge_pages += 1
+                except OSError as e:
+                    self.logger.debug(f"madvise(MADV_HUGEPAGE) failed for {path}: {e}")
+                try:
+                    mapped.madvise(mmap.MADV_WILLNEED)
+                except OSError as e:
+                    self.logger.debug(f"madvise(MADV_WILLNEED) failed for {path}: {e}")
+                # Keep the mapping alive so the advice stays in effect
+                self._mmaps.append(mapped)
+        self.logger.info(
+            f"Mapped {len(self._mmaps)} index files, {huge_pages} advised for huge pages"
+        )
+
+    def _release_index_files(self) -> None:
+        """Close the mappings made by _advise_index_files"""
+        mmaps, self._mmaps = self._mmaps, []
+        for mapped in mmaps:
+            try:
+                mapped.close()
+            except:
+                pass
 
-    async def _run_in_executor(self, func, *args):
-        """Run blocking operations in a thread pool executor"""
-        loop = asyncio.get_event_loop()
-        return await loop.run_in_executor(None, partial(func, *args))
+    async def refresh(self) -> None:
+        """Reload the index and swap in a fresh searcher so new segments become visible"""
+        loop = asyncio.get_running_loop()
+        async with self._reload_lock:
+            await loop.run_in_executor(self._executor, self.index.reload)
+            self.searcher = await loop.run_in_executor(self._executor, self.index.searcher)
+            self.invalidate()
+            # Drop mappings of replaced segment files and advise the new ones
+            await loop.run_in_executor(self._executor, self._advise_index_files)
+            self.logger.info(f"Reloaded Tantivy index at {self.index_path}")
 
-    async def search(self, query: str, num_results: int = 10) -> List[Dict[str, Any]]:
-        """Search the Tantivy index with the given query using Tantivy's query syntax"""
+    async def search(
+        self, query: str, num_results: int = 10, include_highlights: bool = True
+    ) -> List[SearchHit]:
+        """Search the Tantivy index with the given query using Tantivy's query syntax.
+
+        With include_highlights=False the snippet extraction is skipped and
+        each result's highlights is None.
+        """
         if not self.searcher:
             self.logger.error("Searcher not initialized")
             return []
 
+        key = (query, num_results, include_highlights)
+        generation = self._generation
+        while True:
+            cached = self._result_cache.get(key)
+            if cached is not None:
+                self._result_cache.move_to_end(key)
+                return copy.copy(cached)
+
+            # Share the result of an identical query that is already running.
+            # shield() keeps our own cancellation from cancelling the shared future
+            pending = self._in_flight.get(key)
+            if pending is None or pending[0] != generation:
+                break
+            results = await asyncio.shield(pending[1])
+            if results is not None:
+                return copy.copy(results)
+            # The search we joined was cancelled; look again and run it ourselves if needed
+
+        future = asyncio.get_running_loop().create_future()
+        entry = (generation, future)
+        self._in_flight[key] = entry
         try:
-            # Parse and execute the query
-            try:
-                # First try with lenient parsing in the thread pool
-                query_parser = await self._run_in_executor(self.index.parse_query_lenient, query)
-                search_results = await self._run_in_executor(
-                    self.searcher.search, query_parser[0], num_results
-                )
-                search_results = search_results.hits
-                
-            except Exception as query_error:
-                self.logger.error(f"Lenient query parsing failed: {query_error}")
-                return []
-            
-            # Process results
-            results = []
-            for score, doc_address in search_results:
-                # Get document in thread pool
-                doc = await self._run_in_executor(self.searcher.doc, doc_address)
-                text = doc.get_first("text")
-                if not text:
-                    continue
-                
-                # Extract highlighted snippets based on query terms
-                # Remove special syntax for highlighting while preserving Hebrew
-                highlight_terms = re.sub(
-                    r'[:"()[\]{}^~*\\]|\b(AND|OR|NOT|TO|IN)\b|[-+]', 
-                    ' ', 
-                    query
-                ).strip()
-                highlight_terms = [term for term in highlight_terms.split() if len(term) > 1]
-                
-                # Create regex pattern for highlighting
-                if highlight_terms:
-                    # Escape regex special chars but preserve Hebrew
-                    patterns = [re.escape(term) for term in highlight_terms]
-                    pattern = '|'.join(patterns)
-                    # Get surrounding context for matches
-                    matches = list(re.finditer(pattern, text, re.IGNORECASE))
-                    if matches:
-                        highlights = []
-                        for match in matches:
-                            start = max(0, match.start() - 100)
-                            end = min(len(text), match.end() + 100)
-                            highlight = text[start:end]
-                            if start > 0:
-                                highlight = f"...{highlight}"
-                            if end < len(text):
-                                highlight = f"{highlight}..."
-                            highlights.append(highlight)
-                    else:
-                        highlights = [text[:100] + "..." if len(text) > 100 else text]
-                else:
-                    highlights = [text[:100] + "..." if len(text) > 100 else text]
-                
-                result = {
-                    "score": float(score),
-                    "title": doc.get_first("title") or os.path.basename(doc.get_first("filePath") or ""),
-                    "reference": doc.get_first("reference"),
-                    "topics": doc.get_first("topics"),
-                    "file_path": doc.get_first("filePath"),
-                    "line_number": doc.get_first("segment"),
-                    "is_pdf": doc.get_first("isPdf"),
-                    "text": text,
-                    "highlights": highlights
-                }
-                results.append(result)
-            
-            self.logger.info(f"Found {len(results)} results for query: {query}")
-            return results
-            
+            results = await self._execute_search(query, num_results, include_highlights)
         except Exception as e:
             self.logger.error(f"Error during search: {str(e)}")
+            if not future.done():
+                future.set_result([])
+            return []
+        except BaseException:
+            # Wake the waiting callers without cancelling them; None makes them retry
+            if not future.done():
+                future.set_result(None)
+            raise
+        finally:
+            if self._in_flight.get(key) is entry:
+                del self._in_flight[key]
+
+        # Results from a searcher replaced by refresh() must not enter the new cache
+        if generation == self._generation:
+            self._result_cache[key] = results
+            if len(self._result_cache) > RESULT_CACHE_SIZE:
+                self._result_cache.popitem(last=False)
+        if not future.done():
+            future.set_result(results)
+        return copy.copy(results)
+
+    def invalidate(self) -> None:
+        """Drop all cached search results; searches already running won't be cached or shared"""
+        self._generation += 1
+        self._result_cache.clear()
+
+    def _parse_query(self, query: str):
+        """Parse the query leniently, reusing the parsed Query for repeated query strings"""
+        with self._qcache_lock:
+            parsed = self._qcache.get(query)
+            if parsed is not None:
+                self._qcache.move_to_end(query)
+                return parsed
+        # Lenient parsing tolerates malformed user queries
+        parsed = self.index.parse_query_lenient(query)[0]
+        with self._qcache_lock:
+            self._qcache[query] = parsed
+            if len(self._qcache) > QUERY_CACHE_SIZE:
+                self._qcache.popitem(last=False)
+        return parsed
+
+    def _do_search_sync(self, query: str, num_results: int) -> List[tuple]:
+        """Parse and execute the query, returning (score, stored fields) pairs; runs in the thread pool"""
+        searcher = self.searcher
+        try:
+            hits = searcher.search(self._parse_query(query), num_results).hits
+        except Exception as query_error:
+            self.logger.error(f"Lenient query parsing failed: {query_error}")
             return []
+        # tantivy-py has no multi-document fetch, so the per-hit doc() calls are
+        # batched here on the worker thread rather than one executor hop each.
+        # to_dict() copies all stored fields in one call instead of a get_first() per field
+        fetch_doc = searcher.doc
+        return [(score, fetch_doc(doc_address).to_dict()) for score, doc_address in hits]
+
+    async def _execute_search(
+        self, query: str, num_results: int, include_highlights: bool
+    ) -> List[SearchHit]:
+        """Run the query against the index and build the search hits"""
+        # Parse, search and fetch all hit documents in a single thread pool hop
+        search_results = await asyncio.get_running_loop().run_in_executor(
+            self._executor, self._do_search_sync, query, num_results
+        )
+        
+        if include_highlights:
+            # Extract highlight terms once per query
+            # Remove special syntax for highlighting while preserving Hebrew
+            highlight_terms = _CLEAN_RE.sub(' ', query).strip()
+            highlight_terms = [
+                _fold(term)[0]
+                for term in dict.fromkeys(highlight_terms.split()) if len(term) > 1
+            ]
+        
+        # Process results
+        results = []
+        for score, fields in search_results:
+            text = _first(fields, "text")
+            if not text:
+                continue
+            
+            # Get surrounding context for matches
+            highlights = _extract_highlights(text, highlight_terms) if include_highlights else None
+            
+            result = SearchHit(
+                score=float(score),
+                title=_first(fields, "title") or os.path.basename(_first(fields, "filePath") or ""),
+                reference=_first(fields, "reference"),
+                topics=_first(fields, "topics"),
+                file_path=_first(fields, "filePath"),
+                line_number=_first(fields, "segment"),
+                is_pdf=_first(fields, "isPdf"),
+                text=text,
+                highlights=highlights
+            )
+            results.append(result)
+        
+        self.logger.info("Found %d results for query: %s", len(results), query)
+        return results
 
-    async def validate_index(self) -> bool:
-        """Validate that the index exists and is accessible"""
+    def validate_index(self) -> bool:
+        """Validate that the index exists and is accessible, warming it up for the first query"""
         if not self.searcher:
             return False
             
         try:
-            # Parse and execute a simple query in the thread pool
-            query_parser = await self._run_in_executor(self.index.parse_query, "*")
-            await self._run_in_executor(self.searcher.search, query_parser, 1)
+            # Parse and execute a simple query
+            query_parser = self.index.parse_query("*")
+            self.searcher.search(query_parser, 1)
+            # Touch the term dictionary, postings and doc store for a common term
+            self._do_search_sync(WARMUP_QUERY, 10)
             return True
         except Exception as e:
             self.logger.error(f"Index validation failed: {e}")
@@ -129,3 +374,8 @@ class TantivySearchAgent:
                 self.searcher.close()
             except:
                 pass
+        if hasattr(self, "_mmaps"):
+            self._release_index_files()
+        executor = getattr(self, "_executor", None)
+        if executor:
+            executor.shutdown(wait=False)
@@ -0,0 +1,54 @@
+import os
+import sys
+
+import pytest
+import tantivy
+
+# Import the search agent module directly: importing the jewish_library
+# package also starts the MCP server, which needs the real index
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src", "jewish_library"))
+
+from tantivy_search_agent import TantivySearchAgent
+
+
+def _schema():
+    builder = tantivy.SchemaBuilder()
+    for name in ("text", "title", "reference", "topics", "filePath"):
+        builder.add_text_field(name, stored=True)
+    builder.add_integer_field("segment", stored=True)
+    builder.add_boolean_field("isPdf", stored=True)
+    return builder.build()
+
+
+def add_documents(index_path, texts):
+    """Append one document per text to the index at index_path and commit"""
+    index = tantivy.Index(_schema(), path=str(index_path))
+    writer = index.writer()
+    for i, text in enumerate(texts):
+        writer.add_document(tantivy.Document(
+            text=[text],
+            reference=[f"reference {i}"],
+            topics=["תנך"],
+            filePath=[f"/books/{i}.txt"],
+            segment=[i],
+            isPdf=[False],
+        ))
+    writer.commit()
+    writer.wait_merging_threads()
+
+
+@pytest.fixture
+def index_path(tmp_path):
+    add_documents(tmp_path, ["בראשית ברא אלהים את השמים ואת הארץ", "גזלן קונה בשינוי"])
+    return tmp_path
+
+
+@pytest.fixture
+def add_to_index(index_path):
+    """Callable that appends documents to the test index"""
+    return lambda texts: add_documents(index_path, texts)
+
+
+@pytest.fixture
+def agent(index_path):
+    return TantivySearchAgent(str(index_path))
@@ -0,0 +1,126 @@
+import asyncio
+import unicodedata
+
+
+def _gate_execute_search(agent):
+    """Make agent._execute_search block until the returned event is set, counting calls"""
+    release = asyncio.Event()
+    calls = []
+    execute_search = agent._execute_search
+
+    async def gated(*args):
+        calls.append(args)
+        await release.wait()
+        return await execute_search(*args)
+
+    agent._execute_search = gated
+    return release, calls
+
+
+def test_search_returns_hits(agent):
+    results = asyncio.run(agent.search("גזלן"))
+    assert [hit.reference for hit in results] == ["reference 1"]
+    assert results[0].highlights == ["גזלן קונה בשינוי"]
+
+
+def test_cancelled_follower_does_not_break_leader(agent):
+    async def scenario():
+        release, calls = _gate_execute_search(agent)
+        leader = asyncio.create_task(agent.search("גזלן"))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(agent.search("גזלן"))
+        await asyncio.sleep(0)
+        follower.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        results = await leader
+        assert follower.cancelled()
+        assert len(calls) == 1
+        return results
+
+    results = asyncio.run(scenario())
+    assert [hit.reference for hit in results] == ["reference 1"]
+
+
+def test_cancelled_leader_does_not_cancel_follower(agent):
+    async def scenario():
+        release, calls = _gate_execute_search(agent)
+        leader = asyncio.create_task(agent.search("גזלן"))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(agent.search("גזלן"))
+        await asyncio.sleep(0)
+        leader.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        results = await follower
+        assert leader.cancelled()
+        # The follower ran the search itself after the leader went away
+        assert len(calls) == 2
+        return results
+
+    results = asyncio.run(scenario())
+    assert [hit.reference for hit in results] == ["reference 1"]
+
+
+def test_search_started_before_refresh_is_not_cached_or_shared(agent, add_to_index):
+    async def scenario():
+        release, calls = _gate_execute_search(agent)
+        stale = asyncio.create_task(agent.search("בשינוי"))
+        await asyncio.sleep(0)
+        add_to_index(["בשינוי רשות"])
+        await agent.refresh()
+        fresh = asyncio.create_task(agent.search("בשינוי"))
+        await asyncio.sleep(0)
+        release.set()
+        await stale
+        results = await fresh
+        # The post-refresh search ran on its own instead of joining the stale one
+        assert len(calls) == 2
+        return results, list(agent._result_cache.values())
+
+    results, cached = asyncio.run(scenario())
+    assert len(results) == 2
+    assert [len(hits) for hits in cached] == [2]
+
+
+def test_refresh_remaps_index_files(agent, add_to_index):
+    old_mmaps = list(agent._mmaps)
+    add_to_index(["בשינוי רשות"])
+    asyncio.run(agent.refresh())
+    assert all(mapped.closed for mapped in old_mmaps)
+    if old_mmaps:
+        # The new segment's files are mapped alongside the original ones
+        assert len(agent._mmaps) > len(old_mmaps)
+
+
+def test_highlights_are_sliced_from_the_original_text():
+    from tantivy_search_agent import _extract_highlights
+
+    # Dagesh (U+05BC) before qamats (U+05B8) is not in NFC mark order
+    text = "בָּרא שמים"
+    assert not unicodedata.is_normalized("NFC", text)
+    term = unicodedata.normalize("NFC", "בָּרא").casefold()
+    assert _extract_highlights(text, [term]) == [text]
+
+
+def test_highlights_match_case_insensitively_despite_length_changing_characters():
+    from tantivy_search_agent import _extract_highlights
+
+    # ß casefolds to "ss", shifting every later folded offset by one
+    text = "Stra\u00dfe " + "\u05d0" * 300 + " Moses " + "\u05d1" * 150
+    start = text.index("Moses")
+    expected = "..." + text[start - 100:start + len("Moses") + 100] + "..."
+    assert _extract_highlights(text, ["moses"]) == [expected]
+
+
+def test_highlights_match_non_nfc_terms_next_to_presentation_forms():
+    from tantivy_search_agent import _extract_highlights
+
+    # U+FB2A (shin with shin dot) decomposes under NFC, changing the length;
+    # the word has dagesh (U+05BC) before qamats (U+05B8), which is not NFC order
+    word = "\u05d1\u05bc\u05b8\u05e8\u05d0"
+    text = "\ufb2a " + "\u05d0" * 300 + " " + word + " \u05e9\u05de\u05d9\u05dd"
+    assert not unicodedata.is_normalized("NFC", word)
+    term = unicodedata.normalize("NFC", word).casefold()
+    start = text.index(word)
+    assert _extract_highlights(text, [term]) == ["..." + text[start - 100:]]